@@ -1,15 +1,23 @@
 """
 FastAPI 路由定义
 """
+import asyncio
+from datetime import datetime, timedelta
 from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException, Form, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, Form, UploadFile, File, Query
+from fastapi.responses import PlainTextResponse
 from sqlalchemy.orm import Session
 
+from src.config import settings
 from src.db.database import get_db
-from src.db.models import Bot
-from src.lark.client import LarkClient
+from src.db.models import Bot, ScheduledMessage
+from src.db.crud import list_bots_page, update_bot, import_bots, export_bots
+from src.lark.client import LarkClient, forget_token
+from src.lark.breaker import CircuitOpenError, breaker_states
+from src.scheduler import scheduler, schedule_message, to_utc_naive, PENDING, CANCELLED
+from src.tracing import span, mark
 from src.api.schemas import (
-    BotCreate, BotResponse, BotListResponse,
+    BotCreate, BotUpdate, BotResponse, BotListResponse, BotImportRequest,
     SuccessResponse, ErrorResponse
 )
 
@@ -39,15 +47,67 @@ async def create_bot(bot: BotCreate, db: Session = Depends(get_db)):
 
 
 @router.get("/api/bots", response_model=BotListResponse, tags=["机器人管理"])
-async def list_bots(db: Session = Depends(get_db)):
-    """列出所有机器人"""
-    bots = db.query(Bot).all()
+async def list_bots(
+    limit: int = Query(100, ge=1, le=1000, description="每页数量"),
+    after_id: Optional[int] = Query(None, description="游标: 上一页返回的 next_cursor"),
+    enabled: Optional[bool] = Query(None, description="按启用状态过滤"),
+    name: Optional[str] = Query(None, description="按名称前缀过滤"),
+    app_id: Optional[str] = Query(None, description="按 App ID 过滤"),
+    db: Session = Depends(get_db)
+):
+    """分页列出机器人"""
+    bots, next_cursor, total = list_bots_page(
+        db, limit, after_id, enabled=enabled, name_prefix=name, app_id=app_id
+    )
     return BotListResponse(
-        total=len(bots),
-        items=[BotResponse(**b.to_dict()) for b in bots]
+        total=total,
+        items=[BotResponse(**b.to_dict()) for b in bots],
+        next_cursor=next_cursor
     )
 
 
+@router.post("/api/bots/import", response_model=SuccessResponse, tags=["机器人管理"])
+async def import_bots_api(req: BotImportRequest, db: Session = Depends(get_db)):
+    """批量导入机器人 (单个事务)"""
+    try:
+        stats = import_bots(db, [b.model_dump() for b in req.bots], upsert=req.upsert)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    for app_id in stats.pop("rotated_app_ids"):
+        forget_token(app_id)
+
+    return SuccessResponse(message="机器人导入完成", data=stats)
+
+
+@router.get("/api/bots/export", response_model=SuccessResponse, tags=["机器人管理"])
+async def export_bots_api(db: Session = Depends(get_db)):
+    """导出机器人配置 (不含 app_secret, 含密钥导出请使用 CLI)"""
+    return SuccessResponse(message="机器人导出成功", data={"bots": export_bots(db)})
+
+
+@router.patch("/api/bots/{bot_id}", response_model=SuccessResponse, tags=["机器人管理"])
+async def patch_bot(bot_id: int, update: BotUpdate, db: Session = Depends(get_db)):
+    """更新机器人 (启用/禁用、轮换密钥)"""
+    fields = update.model_dump(exclude_unset=True, exclude_none=True)
+    if not fields:
+        raise HTTPException(status_code=400, detail="至少提供一个要修改的字段")
+
+    bot = db.query(Bot).filter(Bot.id == bot_id).first()
+    if not bot:
+        raise HTTPException(status_code=404, detail=f"机器人 ID={bot_id} 不存在")
+
+    old_app_id = bot.app_id
+    credentials_changed = update_bot(bot, **fields)
+    db.commit()
+    db.refresh(bot)
+
+    if credentials_changed:
+        forget_token(old_app_id)
+
+    return SuccessResponse(message="机器人更新成功", data=bot.to_dict())
+
+
 @router.delete("/api/bots/{bot_id}", response_model=SuccessResponse, tags=["机器人管理"])
 async def delete_bot(bot_id: int, db: Session = Depends(get_db)):
     """删除机器人"""
@@ -71,6 +131,8 @@ async def send_message(
     title: Optional[str] = Form(None, description="消息标题 (富文本时使用)"),
     content: Optional[str] = Form(None, description="文本内容"),
     images: list[UploadFile] = File(default=[], description="图片文件列表（支持多张）"),
+    send_at: Optional[datetime] = Form(None, description="定时发送时间 (ISO 8601, 不带时区按服务器本地时间)"),
+    delay: Optional[int] = Form(None, ge=0, description="延迟发送秒数"),
     db: Session = Depends(get_db)
 ):
     """
@@ -82,23 +144,61 @@ async def send_message(
     - 只有单张 image -> 纯图片
     - 多张 images -> 富文本多图
     - images + content (+ title) -> 图文混合
+
+    提供 send_at 或 delay 时保存为定时消息, 由服务内调度器到期发送
     """
+    # 请求体解析 (multipart) 和依赖注入耗时
+    mark("parse")
+
     # 参数验证
     if not content and not images:
         raise HTTPException(status_code=400, detail="content 或 images 至少提供一个")
+    if send_at is not None and delay is not None:
+        raise HTTPException(status_code=400, detail="send_at 和 delay 只能提供一个")
 
     # 获取机器人配置
-    bot = db.query(Bot).filter(Bot.name == bot_name, Bot.enabled == True).first()
+    with span("bot_lookup"):
+        bot = db.query(Bot).filter(Bot.name == bot_name, Bot.enabled == True).first()
     if not bot:
         raise HTTPException(status_code=404, detail=f"机器人 '{bot_name}' 不存在或已禁用")
 
     # 读取所有图片数据
     image_data_list = []
     if images:
-        for img in images:
-            data = await img.read()
-            if data:  # 只添加非空图片
-                image_data_list.append(data)
+        with span("image_read", count=len(images)):
+            for img in images:
+                data = await img.read()
+                if data:  # 只添加非空图片
+                    image_data_list.append(data)
+
+    # 定时消息: 入库后立即返回
+    if send_at is not None or delay is not None:
+        if send_at is not None:
+            scheduled_at = to_utc_naive(send_at)
+        else:
+            scheduled_at = datetime.utcnow() + timedelta(seconds=delay)
+
+        with span("schedule"):
+            job = schedule_message(
+                db,
+                bot_name=bot_name,
+                receive_id=receive_id,
+                receive_id_type=receive_id_type,
+                title=title,
+                content=content,
+                image_data_list=image_data_list or None,
+                send_at=scheduled_at
+            )
+        return SuccessResponse(
+            message="消息已加入定时发送",
+            data={
+                "scheduled_id": job.id,
+                "send_at": job.send_at.isoformat(),
+                "bot_name": bot_name,
+                "receive_id": receive_id,
+                "images_count": job.images_count
+            }
+        )
 
     # 创建飞书客户端并发送消息
     client = LarkClient(app_id=bot.app_id, app_secret=bot.app_secret)
@@ -121,13 +221,83 @@ async def send_message(
                 "images_count": len(image_data_list)
             }
         )
+    except CircuitOpenError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(max(int(e.retry_after), 1))}
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# ==================== 定时消息 ====================
+
+@router.get("/api/scheduled/{scheduled_id}", response_model=SuccessResponse, tags=["定时消息"])
+async def get_scheduled(scheduled_id: int, db: Session = Depends(get_db)):
+    """查询定时消息状态"""
+    job = db.query(ScheduledMessage).filter(ScheduledMessage.id == scheduled_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail=f"定时消息 ID={scheduled_id} 不存在")
+    return SuccessResponse(message="查询成功", data=job.to_dict())
+
+
+@router.delete("/api/scheduled/{scheduled_id}", response_model=SuccessResponse, tags=["定时消息"])
+async def cancel_scheduled(scheduled_id: int, db: Session = Depends(get_db)):
+    """取消尚未发送的定时消息"""
+    updated = (
+        db.query(ScheduledMessage)
+        .filter(ScheduledMessage.id == scheduled_id, ScheduledMessage.status == PENDING)
+        .update({ScheduledMessage.status: CANCELLED, ScheduledMessage.images: None}, synchronize_session=False)
+    )
+    db.commit()
+    if not updated:
+        raise HTTPException(status_code=404, detail=f"定时消息 ID={scheduled_id} 不存在或已处理")
+    return SuccessResponse(message=f"定时消息 ID={scheduled_id} 已取消")
+
+
 # ==================== 健康检查 ====================
 
 @router.get("/health", tags=["系统"])
 async def health_check():
-    """健康检查"""
-    return {"status": "ok", "service": "LarkMsgServer"}
+    """健康检查 (含各机器人飞书接口熔断状态和定时调度状态)"""
+    breakers = breaker_states()
+    # half_open 表示冷却已结束、等待探测, 不视为降级
+    degraded = any(
+        b["state"] == "open"
+        for endpoints in breakers.values()
+        for b in endpoints.values()
+    )
+    return {
+        "status": "degraded" if degraded else "ok",
+        "service": "LarkMsgServer",
+        "breakers": breakers,
+        "scheduler": scheduler.stats()
+    }
+
+
+# ==================== 性能诊断 ====================
+
+@router.get("/debug/profile", response_class=PlainTextResponse, tags=["系统"])
+async def profile(
+    seconds: float = Query(10, gt=0, le=300, description="采样时长 (秒)"),
+    interval: float = Query(0.005, ge=0.001, le=1, description="采样间隔 (秒)")
+):
+    """
+    采样分析运行中的服务, 返回折叠栈 (可用 flamegraph.pl / speedscope 生成火焰图)
+
+    需设置 LARK_PROFILER_ENABLED=true
+    """
+    if not settings.profiler_enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+    from src.profiler import SamplingProfiler
+
+    profiler = SamplingProfiler(interval=interval)
+    profiler.start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.stop()
+
+    return profiler.folded()
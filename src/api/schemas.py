@@ -24,10 +24,29 @@ class BotResponse(BaseModel):
     updated_at: Optional[str] = None
 
 
+class BotUpdate(BaseModel):
+    """更新机器人请求 (只修改提供的字段)"""
+    app_id: Optional[str] = Field(None, description="飞书 App ID", min_length=1)
+    app_secret: Optional[str] = Field(None, description="飞书 App Secret", min_length=1)
+    enabled: Optional[bool] = Field(None, description="是否启用")
+
+
 class BotListResponse(BaseModel):
     """机器人列表响应"""
-    total: int
+    total: Optional[int] = Field(None, description="符合条件的总数 (仅第一页返回)")
     items: list[BotResponse]
+    next_cursor: Optional[int] = Field(None, description="下一页游标 (传给 after_id), 为空表示没有更多")
+
+
+class BotImportItem(BotCreate):
+    """批量导入的单个机器人"""
+    enabled: Optional[bool] = Field(None, description="是否启用 (不填时新建默认启用, 更新时保持原状态)")
+
+
+class BotImportRequest(BaseModel):
+    """批量导入机器人请求"""
+    bots: list[BotImportItem] = Field(..., description="机器人列表")
+    upsert: bool = Field(default=True, description="同名机器人已存在时是否更新")
 
 
 # ========== 消息发送 ==========
@@ -1,17 +1,16 @@
 """
 Typer CLI 命令行接口
+
+各子命令只在函数内导入自己用到的模块 (数据库、飞书客户端、FastAPI 等),
+脚本频繁调用 send 时不必加载整个服务
 """
-import asyncio
+import os
+from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Optional
 
 import typer
 
-from src.config import settings
-from src.db.database import init_db, SessionLocal
-from src.db.models import Bot
-from src.lark.client import LarkClient
-
 app = typer.Typer(help="飞书消息发送服务 CLI")
 
 
@@ -19,26 +18,50 @@ app = typer.Typer(help="飞书消息发送服务 CLI")
 
 @app.command()
 def serve(
-    host: str = typer.Option(settings.server_host, "--host", "-h", help="监听地址"),
-    port: int = typer.Option(settings.server_port, "--port", "-p", help="监听端口")
+    host: Optional[str] = typer.Option(None, "--host", "-h", help="监听地址 (默认 LARK_SERVER_HOST)"),
+    port: Optional[int] = typer.Option(None, "--port", "-p", help="监听端口 (默认 LARK_SERVER_PORT)"),
+    trace: bool = typer.Option(False, "--trace", help="开启请求追踪 (Server-Timing 响应头 + JSON 日志)"),
+    profile: Optional[Path] = typer.Option(None, "--profile", help="采样分析整个运行期间, 退出时写入折叠栈文件")
 ):
     """启动 HTTP 服务"""
     import uvicorn
+    from src.config import settings
+    from src.db.database import init_db
     from src.main import create_app
+
+    host = host or settings.server_host
+    port = port or settings.server_port
+    if trace:
+        settings.tracing_enabled = True
     
     # 初始化数据库
     init_db()
     
     typer.echo(f"🚀 启动服务: http://{host}:{port}")
     typer.echo(f"📖 API 文档: http://{host}:{port}/docs")
-    
-    uvicorn.run(create_app(), host=host, port=port)
+
+    profiler = None
+    if profile:
+        from src.profiler import SamplingProfiler
+
+        profiler = SamplingProfiler()
+        profiler.start()
+
+    try:
+        uvicorn.run(create_app(), host=host, port=port)
+    finally:
+        if profiler:
+            profiler.stop()
+            profile.write_text(profiler.folded(), encoding="utf-8")
+            typer.echo(f"🔥 采样结果已写入 {profile} (可用 flamegraph.pl / speedscope 查看)")
 
 
 @app.command()
 def init():
     """初始化数据库"""
-    init_db()
+    from src.db.database import init_db
+
+    init_db(force=True)
     typer.echo("✅ 数据库初始化完成")
 
 
@@ -55,6 +78,9 @@ def bot_add(
     app_secret: str = typer.Option(..., "--app-secret", help="飞书 App Secret")
 ):
     """添加机器人"""
+    from src.db.database import init_db, SessionLocal
+    from src.db.models import Bot
+
     init_db()
     db = SessionLocal()
     
@@ -75,31 +101,197 @@ def bot_add(
 
 
 @bot_app.command("list")
-def bot_list():
-    """列出所有机器人"""
+def bot_list(
+    enabled: Optional[bool] = typer.Option(None, "--enabled/--disabled", help="按启用状态过滤"),
+    name: Optional[str] = typer.Option(None, "--name", "-n", help="按名称前缀过滤"),
+    limit: Optional[int] = typer.Option(None, "--limit", "-l", help="最多显示数量 (默认全部)")
+):
+    """列出机器人"""
+    from src.db.database import init_db, SessionLocal
+    from src.db.crud import list_bots_page
+
     init_db()
     db = SessionLocal()
     
     try:
-        bots = db.query(Bot).all()
-        
-        if not bots:
-            typer.echo("📭 暂无机器人")
-            return
-        
-        typer.echo(f"📋 机器人列表 (共 {len(bots)} 个):\n")
-        for bot in bots:
-            status = "✅" if bot.enabled else "❌"
-            typer.echo(f"  {status} [{bot.id}] {bot.name} (App ID: {bot.app_id})")
+        # 按 id 游标分页读取, 避免一次性加载全部机器人
+        page_size = 500
+        after_id = None
+        shown = 0
+        total = None
+
+        while True:
+            size = page_size if limit is None else min(page_size, limit - shown)
+            if size <= 0:
+                break
+
+            bots, after_id, count = list_bots_page(
+                db, size, after_id, enabled=enabled, name_prefix=name
+            )
+            if total is None:
+                total = count
+                if not total:
+                    typer.echo("📭 暂无机器人")
+                    return
+                typer.echo(f"📋 机器人列表 (共 {total} 个):\n")
+
+            for bot in bots:
+                status = "✅" if bot.enabled else "❌"
+                typer.echo(f"  {status} [{bot.id}] {bot.name} (App ID: {bot.app_id})")
+            shown += len(bots)
+
+            if after_id is None:
+                break
+            # 已输出的对象不再需要, 释放内存
+            db.expunge_all()
+    finally:
+        db.close()
+
+
+@bot_app.command("update")
+def bot_update(
+    name: str = typer.Argument(..., help="机器人名称"),
+    app_id: Optional[str] = typer.Option(None, "--app-id", help="新的飞书 App ID"),
+    app_secret: Optional[str] = typer.Option(None, "--app-secret", help="新的飞书 App Secret"),
+    enabled: Optional[bool] = typer.Option(None, "--enable/--disable", help="启用或禁用")
+):
+    """更新机器人 (启用/禁用、轮换密钥)"""
+    if app_id is None and app_secret is None and enabled is None:
+        typer.echo("❌ 请提供 --app-id、--app-secret 或 --enable/--disable", err=True)
+        raise typer.Exit(1)
+
+    from src.db.database import init_db, SessionLocal
+    from src.db.models import Bot
+    from src.db.crud import update_bot
+    from src.lark.client import forget_token
+
+    init_db()
+    db = SessionLocal()
+
+    try:
+        bot = db.query(Bot).filter(Bot.name == name).first()
+        if not bot:
+            typer.echo(f"❌ 机器人 '{name}' 不存在", err=True)
+            raise typer.Exit(1)
+
+        old_app_id = bot.app_id
+        credentials_changed = update_bot(bot, app_id, app_secret, enabled)
+        db.commit()
+
+        if credentials_changed:
+            forget_token(old_app_id)
+
+        typer.echo(f"✅ 机器人 '{name}' 已更新")
     finally:
         db.close()
 
 
+@bot_app.command("import")
+def bot_import(
+    file: Path = typer.Argument(..., exists=True, dir_okay=False, help="YAML/JSON 文件"),
+    upsert: bool = typer.Option(True, "--upsert/--no-upsert", help="同名机器人已存在时是否更新")
+):
+    """
+    从 YAML/JSON 文件批量导入机器人 (单个事务)
+
+    文件格式 (JSON 同结构):
+
+        bots:
+          - name: mybot
+            app_id: cli_xxx
+            app_secret: xxx
+            enabled: true
+    """
+    import yaml
+    from pydantic import ValidationError
+    from src.api.schemas import BotImportItem
+    from src.db.database import init_db, SessionLocal
+    from src.db.crud import import_bots
+    from src.lark.client import forget_token
+
+    try:
+        # YAML 是 JSON 的超集, 两种格式统一用 safe_load 解析
+        raw = yaml.safe_load(file.read_text(encoding="utf-8")) or {}
+        raw_bots = raw.get("bots", []) if isinstance(raw, dict) else raw
+        if not isinstance(raw_bots, list):
+            typer.echo("❌ 文件格式错误: bots 必须是列表", err=True)
+            raise typer.Exit(1)
+        items = [BotImportItem(**b).model_dump() for b in raw_bots]
+    except (yaml.YAMLError, TypeError, ValidationError) as e:
+        typer.echo(f"❌ 文件格式错误: {e}", err=True)
+        raise typer.Exit(1)
+
+    init_db()
+    db = SessionLocal()
+
+    try:
+        stats = import_bots(db, items, upsert=upsert)
+    except ValueError as e:
+        typer.echo(f"❌ 导入失败: {e}", err=True)
+        raise typer.Exit(1)
+    finally:
+        db.close()
+
+    for old_app_id in stats.pop("rotated_app_ids"):
+        forget_token(old_app_id)
+
+    typer.echo(
+        f"✅ 导入完成: 新增 {stats['created']}, 更新 {stats['updated']}, "
+        f"未变化 {stats['unchanged']}, 跳过 {stats['skipped']}"
+    )
+
+
+@bot_app.command("export")
+def bot_export(
+    output: Optional[Path] = typer.Option(None, "--output", "-o", help="输出文件 (默认输出到终端)"),
+    fmt: str = typer.Option("yaml", "--format", "-f", help="输出格式: yaml/json"),
+    include_secrets: bool = typer.Option(False, "--include-secrets", help="包含 app_secret (可用于重新导入)")
+):
+    """导出机器人配置"""
+    from src.db.database import init_db, SessionLocal
+    from src.db.crud import export_bots
+
+    if fmt not in ("yaml", "json"):
+        typer.echo(f"❌ 不支持的格式: {fmt}", err=True)
+        raise typer.Exit(1)
+
+    init_db()
+    db = SessionLocal()
+
+    try:
+        data = {"bots": export_bots(db, include_secrets=include_secrets)}
+    finally:
+        db.close()
+
+    if fmt == "json":
+        import json
+        text = json.dumps(data, ensure_ascii=False, indent=2)
+    else:
+        import yaml
+        text = yaml.safe_dump(data, allow_unicode=True, sort_keys=False)
+
+    if output:
+        if include_secrets:
+            # 创建时即设为 600, 已存在的文件也先收紧权限再写入密钥
+            fd = os.open(output, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            os.fchmod(fd, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(text)
+        else:
+            output.write_text(text, encoding="utf-8")
+        typer.echo(f"✅ 已导出 {len(data['bots'])} 个机器人到 {output}")
+    else:
+        typer.echo(text)
+
+
 @bot_app.command("remove")
 def bot_remove(
     name: str = typer.Argument(..., help="机器人名称")
 ):
     """删除机器人"""
+    from src.db.database import init_db, SessionLocal
+    from src.db.models import Bot
+
     init_db()
     db = SessionLocal()
     
@@ -126,7 +318,13 @@ def send(
     id_type: str = typer.Option("open_id", "--id-type", help="ID 类型: open_id/user_id/email"),
     title: Optional[str] = typer.Option(None, "--title", help="消息标题"),
     content: Optional[str] = typer.Option(None, "--content", "-c", help="文本内容"),
-    images: Optional[list[str]] = typer.Option(None, "--image", "-i", help="图片文件路径（可多次指定）")
+    images: Optional[list[str]] = typer.Option(None, "--image", "-i", help="图片文件路径（可多次指定）"),
+    server: Optional[str] = typer.Option(
+        None, "--server", "-s", envvar="LARK_CLI_SERVER",
+        help="交给运行中的服务发送, 如 http://127.0.0.1:234 (不打开本地数据库)"
+    ),
+    at: Optional[str] = typer.Option(None, "--at", help="定时发送时间, 如 2026-01-01T09:00 (不带时区按本地时间)"),
+    delay: Optional[int] = typer.Option(None, "--delay", min=0, help="延迟发送秒数")
 ):
     """
     发送消息
@@ -144,11 +342,53 @@ def send(
 
         # 发送图文混合
         python -m src.main send --bot mybot --to ou_xxx --title "通知" --content "详情" --image ./img.png
+
+        # 交给本机运行中的服务发送 (也可设置环境变量 LARK_CLI_SERVER)
+        python -m src.main send --server http://127.0.0.1:234 --bot mybot --to ou_xxx --content "Hello"
+
+        # 定时发送 (由运行中的服务到期投递; 未指定 --server 时服务最多延迟
+        # LARK_SCHEDULER_LOOKAHEAD_SECONDS / 2 秒才会加载, 需准时发送请加 --server)
+        python -m src.main send --server http://127.0.0.1:234 --bot mybot --to ou_xxx --content "早报" --at 2026-01-01T09:00
     """
     if not content and not images:
         typer.echo("❌ 请提供 --content 或 --image", err=True)
         raise typer.Exit(1)
 
+    if at is not None and delay is not None:
+        typer.echo("❌ --at 和 --delay 只能提供一个", err=True)
+        raise typer.Exit(1)
+
+    send_at = None
+    if at is not None:
+        try:
+            send_at = datetime.fromisoformat(at)
+        except ValueError:
+            typer.echo(f"❌ 时间格式错误: {at}", err=True)
+            raise typer.Exit(1)
+
+    # 读取所有图片
+    image_data_list = None
+    if images:
+        image_data_list = []
+        for img_path_str in images:
+            img_path = Path(img_path_str)
+            if not img_path.exists():
+                typer.echo(f"❌ 图片文件不存在: {img_path}", err=True)
+                raise typer.Exit(1)
+            image_data_list.append(img_path.read_bytes())
+
+        if image_data_list:
+            typer.echo(f"📷 已加载 {len(image_data_list)} 张图片")
+
+    if server:
+        _send_via_server(server, bot, to, id_type, title, content, image_data_list, send_at, delay)
+        return
+
+    import asyncio
+    from src.db.database import init_db, SessionLocal
+    from src.db.models import Bot
+    from src.lark.client import LarkClient
+
     init_db()
     db = SessionLocal()
 
@@ -159,19 +399,33 @@ def send(
             typer.echo(f"❌ 机器人 '{bot}' 不存在或已禁用", err=True)
             raise typer.Exit(1)
 
-        # 读取所有图片
-        image_data_list = None
-        if images:
-            image_data_list = []
-            for img_path_str in images:
-                img_path = Path(img_path_str)
-                if not img_path.exists():
-                    typer.echo(f"❌ 图片文件不存在: {img_path}", err=True)
-                    raise typer.Exit(1)
-                image_data_list.append(img_path.read_bytes())
+        # 定时消息: 写入数据库, 由运行中的服务到期发送
+        if send_at is not None or delay is not None:
+            from src.config import settings
+            from src.scheduler import schedule_message, to_utc_naive
 
-            if image_data_list:
-                typer.echo(f"📷 已加载 {len(image_data_list)} 张图片")
+            if send_at is not None:
+                scheduled_at = to_utc_naive(send_at)
+            else:
+                scheduled_at = datetime.utcnow() + timedelta(seconds=delay)
+
+            job = schedule_message(
+                db,
+                bot_name=bot,
+                receive_id=to,
+                receive_id_type=id_type,
+                title=title,
+                content=content,
+                image_data_list=image_data_list,
+                send_at=scheduled_at
+            )
+            typer.echo(f"⏰ 已加入定时发送 (ID: {job.id}, UTC 时间: {job.send_at.isoformat()})")
+            typer.echo("   需运行 serve 服务才会投递")
+            typer.echo(
+                f"   服务会在 {settings.scheduler_lookahead_seconds / 2:.0f} 秒内加载此消息, "
+                "临近到期的消息可能延迟发送; 需准时发送请使用 --server 或设置 LARK_CLI_SERVER"
+            )
+            return
 
         # 发送消息
         client = LarkClient(app_id=bot_obj.app_id, app_secret=bot_obj.app_secret)
@@ -190,6 +444,8 @@ def send(
         msg_id = result.get("data", {}).get("message_id", "unknown")
         typer.echo(f"✅ 消息发送成功 (message_id: {msg_id})")
 
+    except typer.Exit:
+        raise
     except Exception as e:
         typer.echo(f"❌ 发送失败: {e}", err=True)
         raise typer.Exit(1)
@@ -197,5 +453,63 @@ def send(
         db.close()
 
 
+def _send_via_server(
+    server: str,
+    bot: str,
+    to: str,
+    id_type: str,
+    title: Optional[str],
+    content: Optional[str],
+    image_data_list: Optional[list[bytes]],
+    send_at: Optional[datetime] = None,
+    delay: Optional[int] = None
+):
+    """
+    通过运行中服务的 /api/send 发送消息
+
+    服务端已持有数据库连接和 token 缓存, CLI 只需发起一次本地 HTTP 请求
+    """
+    import httpx
+
+    data = {"bot_name": bot, "receive_id": to, "receive_id_type": id_type}
+    if title:
+        data["title"] = title
+    if content:
+        data["content"] = content
+    if send_at is not None:
+        data["send_at"] = send_at.isoformat()
+    if delay is not None:
+        data["delay"] = str(delay)
+
+    files = [
+        ("images", (f"image_{i}.png", img, "image/png"))
+        for i, img in enumerate(image_data_list or [])
+    ]
+
+    try:
+        resp = httpx.post(
+            f"{server.rstrip('/')}/api/send",
+            data=data,
+            files=files or None,
+            timeout=60
+        )
+        result = resp.json()
+    except Exception as e:
+        typer.echo(f"❌ 发送失败: {e}", err=True)
+        raise typer.Exit(1)
+
+    if resp.status_code != 200:
+        typer.echo(f"❌ 发送失败: {result.get('detail', resp.text)}", err=True)
+        raise typer.Exit(1)
+
+    result_data = result.get("data") or {}
+    if "scheduled_id" in result_data:
+        typer.echo(f"⏰ 已加入定时发送 (ID: {result_data['scheduled_id']}, UTC 时间: {result_data['send_at']})")
+        return
+
+    msg_id = result_data.get("message_id", "unknown")
+    typer.echo(f"✅ 消息发送成功 (message_id: {msg_id})")
+
+
 if __name__ == "__main__":
     app()
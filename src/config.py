@@ -20,7 +20,36 @@ class Settings(BaseSettings):
     
     # 飞书 API 配置
     lark_base_url: str = "https://open.feishu.cn/open-apis"
-    
+
+    # 飞书接口请求超时 (秒), 超时计为失败; 应明显大于 breaker_slow_call_seconds,
+    # 否则慢调用在达到慢调用阈值前就已超时, 慢调用熔断不会生效
+    lark_token_timeout: float = 5.0
+    lark_image_upload_timeout: float = 15.0
+    lark_message_send_timeout: float = 10.0
+
+    # 熔断器配置 (按机器人 + 接口统计)
+    breaker_enabled: bool = True
+    breaker_window_seconds: float = 60.0  # 统计窗口
+    breaker_min_calls: int = 10  # 窗口内最少调用次数
+    breaker_error_rate: float = 0.5  # 失败比例阈值
+    breaker_slow_call_seconds: float = 2.0  # 慢调用耗时阈值 (需小于各接口超时)
+    breaker_slow_call_rate: float = 0.8  # 慢调用比例阈值
+    breaker_open_seconds: float = 30.0  # 熔断持续时间
+    breaker_half_open_calls: int = 1  # 半开状态探测请求数
+
+    # 定时消息调度
+    scheduler_enabled: bool = True
+    scheduler_lookahead_seconds: float = 60.0  # 提前加载多久内到期的消息
+    scheduler_batch_size: int = 1000  # 内存中最多缓存的待发送消息数
+    scheduler_concurrency: int = 5  # 同时投递的消息数 (不超过数据库连接池容量的一半)
+    scheduler_max_attempts: int = 3  # 最大发送尝试次数
+    scheduler_retry_seconds: float = 30.0  # 失败重试基础间隔 (指数退避)
+    scheduler_sending_lease_seconds: float = 600.0  # sending 超过此时长未写回结果时重新投递
+
+    # 性能诊断 (默认关闭)
+    tracing_enabled: bool = False  # 请求追踪: Server-Timing 响应头 + JSON 日志
+    profiler_enabled: bool = False  # 开放 /debug/profile 采样分析接口
+
     # API 认证 (可选)
     api_key: str = ""
     
@@ -1,4 +1,4 @@
 from .database import get_db, init_db, engine
-from .models import Bot
+from .models import Bot, LarkToken, ScheduledMessage
 
-__all__ = ["get_db", "init_db", "engine", "Bot"]
+__all__ = ["get_db", "init_db", "engine", "Bot", "LarkToken", "ScheduledMessage"]
@@ -0,0 +1,167 @@
+"""
+机器人批量操作 (HTTP API 和 CLI 共用)
+"""
+from collections import Counter
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from sqlalchemy.orm import Session, Query
+
+from src.db.models import Bot
+
+# SQLite 单条语句变量数上限为 999, IN 查询分批执行
+_IN_CHUNK = 500
+
+
+def query_bots(
+    db: Session,
+    enabled: Optional[bool] = None,
+    name_prefix: Optional[str] = None,
+    app_id: Optional[str] = None
+) -> Query:
+    """
+    构建带过滤条件的机器人查询
+    """
+    query = db.query(Bot)
+    if enabled is not None:
+        query = query.filter(Bot.enabled == enabled)
+    if name_prefix:
+        query = query.filter(Bot.name.startswith(name_prefix, autoescape=True))
+    if app_id:
+        query = query.filter(Bot.app_id == app_id)
+    return query
+
+
+def list_bots_page(
+    db: Session,
+    limit: int,
+    after_id: Optional[int] = None,
+    **filters
+) -> Tuple[list[Bot], Optional[int], Optional[int]]:
+    """
+    按 id 游标分页查询机器人
+
+    总数只在第一页 (after_id 为空) 统计, 后续翻页不再执行 COUNT
+
+    Args:
+        limit: 每页数量
+        after_id: 上一页最后一个机器人的 id
+        **filters: 透传给 query_bots 的过滤条件
+
+    Returns:
+        (当前页机器人, 下一页游标, 符合条件的总数 (非第一页为 None))
+    """
+    query = query_bots(db, **filters)
+    total = query.count() if after_id is None else None
+
+    if after_id is not None:
+        query = query.filter(Bot.id > after_id)
+    rows = query.order_by(Bot.id).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1].id
+
+    return rows, next_cursor, total
+
+
+def update_bot(
+    bot: Bot,
+    app_id: Optional[str] = None,
+    app_secret: Optional[str] = None,
+    enabled: Optional[bool] = None
+) -> bool:
+    """
+    修改机器人字段 (None 表示不修改, 不提交事务)
+
+    Returns:
+        凭证 (app_id / app_secret) 是否发生变化, 变化时调用方需作废旧 token
+    """
+    credentials_changed = False
+    if app_id is not None and app_id != bot.app_id:
+        bot.app_id = app_id
+        credentials_changed = True
+    if app_secret is not None and app_secret != bot.app_secret:
+        bot.app_secret = app_secret
+        credentials_changed = True
+    if enabled is not None:
+        bot.enabled = enabled
+    return credentials_changed
+
+
+def import_bots(db: Session, items: Iterable[Dict[str, Any]], upsert: bool = True) -> Dict[str, Any]:
+    """
+    批量导入机器人 (单个事务, 任一失败全部回滚)
+
+    Args:
+        items: 机器人字典列表, 包含 name/app_id/app_secret, 可选 enabled
+            (enabled 为 None 时新建默认启用, 更新时保持原状态)
+        upsert: 同名机器人已存在时是否更新, False 时跳过
+
+    Returns:
+        导入统计, rotated_app_ids 为凭证发生变化的旧 app_id 列表
+    """
+    items = list(items)
+    names = [item["name"] for item in items]
+    duplicates = sorted(n for n, c in Counter(names).items() if c > 1)
+    if duplicates:
+        raise ValueError(f"机器人名称重复: {', '.join(duplicates)}")
+
+    existing: Dict[str, Bot] = {}
+    for i in range(0, len(names), _IN_CHUNK):
+        chunk = names[i:i + _IN_CHUNK]
+        for bot in db.query(Bot).filter(Bot.name.in_(chunk)):
+            existing[bot.name] = bot
+
+    stats = {"created": 0, "updated": 0, "unchanged": 0, "skipped": 0}
+    rotated_app_ids = []
+
+    try:
+        for item in items:
+            bot = existing.get(item["name"])
+            if bot is None:
+                db.add(Bot(
+                    name=item["name"],
+                    app_id=item["app_id"],
+                    app_secret=item["app_secret"],
+                    enabled=True if item.get("enabled") is None else item["enabled"]
+                ))
+                stats["created"] += 1
+                continue
+
+            if not upsert:
+                stats["skipped"] += 1
+                continue
+
+            old_app_id = bot.app_id
+            if update_bot(bot, item["app_id"], item["app_secret"], item.get("enabled")):
+                rotated_app_ids.append(old_app_id)
+
+            if db.is_modified(bot):
+                stats["updated"] += 1
+            else:
+                stats["unchanged"] += 1
+
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    stats["rotated_app_ids"] = rotated_app_ids
+    return stats
+
+
+def export_bots(db: Session, include_secrets: bool = False) -> list[Dict[str, Any]]:
+    """
+    导出所有机器人 (包含 app_secret 时可直接用于 import_bots)
+
+    Args:
+        include_secrets: 是否包含 app_secret
+    """
+    result = []
+    for bot in db.query(Bot).order_by(Bot.id).yield_per(_IN_CHUNK):
+        item = {"name": bot.name, "app_id": bot.app_id, "enabled": bot.enabled}
+        if include_secrets:
+            item["app_secret"] = bot.app_secret
+        result.append(item)
+    return result
@@ -36,6 +36,14 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 # 声明基类
 Base = declarative_base()
 
+# 表结构版本 (新增/修改表时 +1, init_db 据此决定是否重新建表)
+SCHEMA_VERSION = 4
+
+# 已有表上新增的列 (create_all 不会修改已存在的表): (表名, 列名, 列定义)
+_ADDED_COLUMNS = [
+    ("scheduled_messages", "claimed_at", "DATETIME"),
+]
+
 
 def get_db() -> Generator[Session, None, None]:
     """
@@ -48,9 +56,33 @@ def get_db() -> Generator[Session, None, None]:
         db.close()
 
 
-def init_db():
+def init_db(force: bool = False):
     """
     初始化数据库 (创建所有表)
+
+    通过 PRAGMA user_version 记录表结构版本, 版本一致时跳过 create_all,
+    避免每次 CLI 调用都检查全部表
+
+    Args:
+        force: 忽略版本号, 强制执行 create_all
     """
-    from src.db.models import Bot  # noqa
+    from src.db.models import Bot, LarkToken, ScheduledMessage  # noqa
+
+    if not force:
+        with engine.connect() as conn:
+            current = conn.exec_driver_sql("PRAGMA user_version").scalar()
+        if current == SCHEMA_VERSION:
+            return
+
     Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        _add_missing_columns(conn)
+        conn.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+
+def _add_missing_columns(conn):
+    """为旧版本数据库补齐新增的列"""
+    for table, column, ddl in _ADDED_COLUMNS:
+        existing = {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table})")}
+        if column not in existing:
+            conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
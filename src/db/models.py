@@ -1,8 +1,11 @@
 """
 数据库模型定义
 """
+import base64
+import json
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Boolean, DateTime
+from typing import Optional
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, Text, Index
 
 from src.db.database import Base
 
@@ -33,3 +36,85 @@ class Bot(Base):
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "updated_at": self.updated_at.isoformat() if self.updated_at else None,
         }
+
+
+class LarkToken(Base):
+    """
+    tenant_access_token 缓存模型
+
+    CLI 进程和服务共享, 避免每次启动都重新获取 token
+    """
+
+    __tablename__ = "lark_tokens"
+
+    app_id = Column(String(100), primary_key=True, comment="飞书 App ID")
+    token = Column(String(200), nullable=False, default="", comment="tenant_access_token")
+    expire_at = Column(Float, nullable=False, default=0, comment="过期时间戳")
+    refreshing_until = Column(Float, nullable=False, default=0, comment="刷新租约到期时间戳")
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, comment="更新时间")
+
+    def __repr__(self):
+        return f"<LarkToken(app_id='{self.app_id}', expire_at={self.expire_at})>"
+
+
+class ScheduledMessage(Base):
+    """
+    定时消息模型
+
+    调度器只按 (status, send_at) 索引读取即将到期的 id, 消息内容在投递时才加载
+    """
+
+    __tablename__ = "scheduled_messages"
+    __table_args__ = (
+        Index("ix_scheduled_messages_status_send_at", "status", "send_at"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    bot_name = Column(String(100), nullable=False, comment="机器人名称")
+    receive_id = Column(String(200), nullable=False, comment="接收者 ID")
+    receive_id_type = Column(String(20), nullable=False, default="open_id", comment="ID 类型")
+    title = Column(Text, nullable=True, comment="消息标题")
+    content = Column(Text, nullable=True, comment="文本内容")
+    images = Column(Text, nullable=True, comment="图片列表 (base64 JSON 数组)")
+    images_count = Column(Integer, nullable=False, default=0, comment="图片数量")
+    send_at = Column(DateTime, nullable=False, comment="计划发送时间 (UTC)")
+    status = Column(String(20), nullable=False, default="pending", comment="状态: pending/sending/sent/failed/cancelled")
+    attempts = Column(Integer, nullable=False, default=0, comment="已失败次数")
+    last_error = Column(Text, nullable=True, comment="最近一次错误")
+    message_id = Column(String(100), nullable=True, comment="飞书消息 ID")
+    claimed_at = Column(DateTime, nullable=True, comment="认领 (进入 sending) 时间, 用于回收超时未完成的投递")
+    created_at = Column(DateTime, default=datetime.utcnow, comment="创建时间")
+    sent_at = Column(DateTime, nullable=True, comment="实际发送时间")
+
+    def __repr__(self):
+        return f"<ScheduledMessage(id={self.id}, bot_name='{self.bot_name}', status='{self.status}')>"
+
+    def set_images(self, image_data_list: Optional[list[bytes]]):
+        """保存图片数据"""
+        image_data_list = image_data_list or []
+        self.images = json.dumps([base64.b64encode(d).decode() for d in image_data_list]) if image_data_list else None
+        self.images_count = len(image_data_list)
+
+    def get_images(self) -> Optional[list[bytes]]:
+        """读取图片数据"""
+        if not self.images:
+            return None
+        return [base64.b64decode(d) for d in json.loads(self.images)]
+
+    def to_dict(self):
+        """转换为字典 (不含图片数据)"""
+        return {
+            "id": self.id,
+            "bot_name": self.bot_name,
+            "receive_id": self.receive_id,
+            "receive_id_type": self.receive_id_type,
+            "title": self.title,
+            "images_count": self.images_count,
+            "send_at": self.send_at.isoformat() if self.send_at else None,
+            "status": self.status,
+            "attempts": self.attempts,
+            "last_error": self.last_error,
+            "message_id": self.message_id,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "sent_at": self.sent_at.isoformat() if self.sent_at else None,
+        }
@@ -1,3 +1,4 @@
 from .client import LarkClient
+from .breaker import CircuitOpenError, breaker_states
 
-__all__ = ["LarkClient"]
+__all__ = ["LarkClient", "CircuitOpenError", "breaker_states"]
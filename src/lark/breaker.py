@@ -0,0 +1,263 @@
+"""
+飞书 API 熔断器
+
+按 (机器人, 接口) 维度统计最近一段时间内的调用结果:
+- CLOSED: 正常放行, 错误率或慢调用比例超过阈值时熔断
+- OPEN: 直接快速失败, 等待冷却时间后进入半开
+- HALF_OPEN: 放行少量探测请求, 全部成功则恢复, 任一失败则重新熔断
+"""
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Deque, Dict, Iterator, Optional, Tuple
+
+from src.config import settings
+
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态, 请求被快速拒绝"""
+
+    def __init__(self, name: str, retry_after: float):
+        self.name = name
+        self.retry_after = retry_after
+        super().__init__(f"飞书接口 '{name}' 已熔断, 请 {retry_after:.0f} 秒后重试")
+
+
+class CircuitBreaker:
+    """
+    滑动时间窗口熔断器
+
+    Args:
+        name: 熔断器名称 (用于日志和健康检查)
+        window_seconds: 统计窗口长度
+        min_calls: 窗口内最少调用次数, 低于此值不触发熔断
+        error_rate: 失败比例阈值
+        slow_call_seconds: 单次调用超过此耗时视为慢调用
+        slow_call_rate: 慢调用比例阈值
+        open_seconds: 熔断后等待多久进入半开
+        half_open_calls: 半开状态允许的探测请求数
+    """
+
+    def __init__(
+        self,
+        name: str,
+        window_seconds: float = 60.0,
+        min_calls: int = 10,
+        error_rate: float = 0.5,
+        slow_call_seconds: float = 5.0,
+        slow_call_rate: float = 0.8,
+        open_seconds: float = 30.0,
+        half_open_calls: int = 1
+    ):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+
+        self.state = CLOSED
+        self._opened_at = 0.0
+        # 每次状态切换 +1, 用于识别跨状态完成的旧调用
+        self._generation = 0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        # (时间戳, 是否失败, 是否慢调用)
+        self._calls: Deque[Tuple[float, bool, bool]] = deque()
+
+    def _trim(self, now: float):
+        """丢弃窗口外的调用记录"""
+        cutoff = now - self.window_seconds
+        while self._calls and self._calls[0][0] < cutoff:
+            self._calls.popleft()
+
+    def _transition(self, state: str):
+        self.state = state
+        self._generation += 1
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self._calls.clear()
+
+    def _open(self, now: float):
+        self._transition(OPEN)
+        self._opened_at = now
+
+    def _close(self):
+        self._transition(CLOSED)
+
+    def _cooled_down(self, now: float) -> bool:
+        """熔断冷却期是否已结束"""
+        return now >= self._opened_at + self.open_seconds
+
+    def check(self):
+        """
+        仅检查是否处于熔断冷却期 (不占用半开探测名额)
+        """
+        now = time.monotonic()
+        if self.state == OPEN and not self._cooled_down(now):
+            raise CircuitOpenError(self.name, self._opened_at + self.open_seconds - now)
+
+    def before_call(self) -> Tuple[int, bool]:
+        """
+        调用前检查, 熔断时抛出 CircuitOpenError
+
+        Returns:
+            (准入时的状态代数, 是否为半开探测), 需原样传给 record_success/record_failure
+        """
+        now = time.monotonic()
+
+        if self.state == OPEN:
+            if not self._cooled_down(now):
+                raise CircuitOpenError(self.name, self._opened_at + self.open_seconds - now)
+            self._transition(HALF_OPEN)
+
+        if self.state == HALF_OPEN:
+            if self._probes_in_flight >= self.half_open_calls:
+                raise CircuitOpenError(self.name, self.open_seconds)
+            self._probes_in_flight += 1
+            return self._generation, True
+
+        return self._generation, False
+
+    def _is_current(self, ticket: Tuple[int, bool]) -> bool:
+        """调用结束时熔断器是否仍处于准入时的状态 (旧调用的结果不再计入)"""
+        return ticket[0] == self._generation
+
+    def record_success(self, elapsed: float, ticket: Tuple[int, bool]):
+        """记录一次成功调用 (耗时超过阈值时计为慢调用)"""
+        if not self._is_current(ticket):
+            return
+
+        now = time.monotonic()
+        slow = elapsed >= self.slow_call_seconds
+
+        if ticket[1]:
+            self._probes_in_flight = max(self._probes_in_flight - 1, 0)
+            if slow:
+                self._open(now)
+                return
+            self._probe_successes += 1
+            if self._probe_successes >= self.half_open_calls:
+                self._close()
+            return
+
+        self._record(now, failed=False, slow=slow)
+
+    def record_failure(self, ticket: Tuple[int, bool]):
+        """记录一次失败调用"""
+        if not self._is_current(ticket):
+            return
+
+        now = time.monotonic()
+
+        if ticket[1]:
+            self._open(now)
+            return
+
+        self._record(now, failed=True, slow=False)
+
+    def _release(self, ticket: Tuple[int, bool]):
+        """调用被取消: 不计入统计, 仅归还半开探测名额"""
+        if ticket[1] and self._is_current(ticket):
+            self._probes_in_flight = max(self._probes_in_flight - 1, 0)
+
+    def _record(self, now: float, failed: bool, slow: bool):
+        if self.state != CLOSED:
+            return
+
+        self._calls.append((now, failed, slow))
+        self._trim(now)
+
+        total = len(self._calls)
+        if total < self.min_calls:
+            return
+
+        failures = sum(1 for _, f, _ in self._calls if f)
+        slows = sum(1 for _, _, s in self._calls if s)
+        if failures / total >= self.error_rate or slows / total >= self.slow_call_rate:
+            self._open(now)
+
+    @contextmanager
+    def guard(self, is_failure: Optional[Callable[[BaseException], bool]] = None) -> Iterator[None]:
+        """
+        包裹一次上游调用
+
+        Args:
+            is_failure: 判断异常是否计入失败, 默认所有异常都计入
+        """
+        ticket = self.before_call()
+        start = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            if is_failure is None or is_failure(e):
+                self.record_failure(ticket)
+            else:
+                self.record_success(time.monotonic() - start, ticket)
+            raise
+        except BaseException:
+            self._release(ticket)
+            raise
+        else:
+            self.record_success(time.monotonic() - start, ticket)
+
+    def snapshot(self) -> dict:
+        """
+        当前状态 (用于健康检查)
+
+        冷却期结束但尚无请求触发探测时报告为 half_open
+        """
+        now = time.monotonic()
+        self._trim(now)
+
+        state = self.state
+        if state == OPEN and self._cooled_down(now):
+            state = HALF_OPEN
+
+        info = {
+            "state": state,
+            "calls": len(self._calls),
+            "failures": sum(1 for _, f, _ in self._calls if f),
+            "slow_calls": sum(1 for _, _, s in self._calls if s),
+        }
+        if state == OPEN:
+            info["retry_after"] = round(self._opened_at + self.open_seconds - now, 1)
+        return info
+
+
+# 进程内共享的熔断器 (LarkClient 按请求创建, 状态需跨实例保留)
+_breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+
+
+def get_breaker(app_id: str, endpoint: str) -> CircuitBreaker:
+    """获取 (机器人, 接口) 对应的熔断器"""
+    key = (app_id, endpoint)
+    breaker = _breakers.get(key)
+    if breaker is None:
+        breaker = CircuitBreaker(
+            name=f"{app_id}:{endpoint}",
+            window_seconds=settings.breaker_window_seconds,
+            min_calls=settings.breaker_min_calls,
+            error_rate=settings.breaker_error_rate,
+            slow_call_seconds=settings.breaker_slow_call_seconds,
+            slow_call_rate=settings.breaker_slow_call_rate,
+            open_seconds=settings.breaker_open_seconds,
+            half_open_calls=settings.breaker_half_open_calls,
+        )
+        _breakers[key] = breaker
+    return breaker
+
+
+def breaker_states() -> Dict[str, Dict[str, dict]]:
+    """所有熔断器状态, 按 app_id -> endpoint 分组"""
+    states: Dict[str, Dict[str, dict]] = {}
+    for (app_id, endpoint), breaker in _breakers.items():
+        states.setdefault(app_id, {})[endpoint] = breaker.snapshot()
+    return states
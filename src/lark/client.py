@@ -1,12 +1,25 @@
 """
 飞书 API 客户端
 """
+import asyncio
 import time
 import httpx
+from contextlib import nullcontext
 from typing import Optional, Dict, Any, Tuple
 from dataclasses import dataclass
 
 from src.config import settings
+from src.lark import token_store
+from src.lark.breaker import get_breaker
+from src.tracing import span
+
+
+# token 提前刷新时间 (秒)
+TOKEN_REFRESH_MARGIN = 300
+# 跨进程刷新租约时长 (秒), 超时后其他进程可自行刷新
+TOKEN_LEASE_SECONDS = 10.0
+# 飞书返回的 token 无效/过期错误码, 遇到时作废缓存并重试一次
+TOKEN_INVALID_CODES = {99991661, 99991663, 99991668}
 
 
 @dataclass
@@ -15,41 +28,135 @@ class TokenInfo:
     token: str
     expire_at: float  # 过期时间戳
 
+    def is_fresh(self) -> bool:
+        return self.expire_at > time.time() + TOKEN_REFRESH_MARGIN
+
+
+# 进程内 token 缓存 (LarkClient 按请求创建, 按 app_id 共享)
+_token_cache: Dict[str, TokenInfo] = {}
+_token_locks: Dict[str, asyncio.Lock] = {}
+
+
+def _is_upstream_failure(exc: BaseException) -> bool:
+    """
+    判断异常是否属于飞书服务端故障 (计入熔断统计)
+
+    网络错误、超时、5xx 和 429 视为故障; 4xx 等请求本身的问题不计入
+    """
+    if isinstance(exc, httpx.TransportError):
+        return True
+    if isinstance(exc, httpx.HTTPStatusError):
+        status = exc.response.status_code
+        return status >= 500 or status == 429
+    return False
+
+
+def forget_token(app_id: str):
+    """
+    作废某个应用已缓存的 token (机器人凭证变更时调用)
+    """
+    _token_cache.pop(app_id, None)
+    token_store.invalidate_token(app_id)
+
 
 class LarkClient:
     """
     飞书 API 客户端
     
     功能:
-    - Token 获取与缓存
+    - Token 获取与缓存 (进程内 + 数据库持久化, 跨进程共享)
     - 图片上传
     - 消息发送 (文本/图片/富文本)
+    - 按接口熔断 (飞书故障时快速失败)
     """
     
     def __init__(self, app_id: str, app_secret: str):
         self.app_id = app_id
         self.app_secret = app_secret
         self.base_url = settings.lark_base_url
-        self._token_cache: Optional[TokenInfo] = None
+
+    def _timeout(self, endpoint: str) -> httpx.Timeout:
+        """指定接口的请求超时"""
+        return httpx.Timeout(getattr(settings, f"lark_{endpoint}_timeout"))
+
+    def _guard(self, endpoint: str):
+        """对指定接口的调用套上熔断器"""
+        if not settings.breaker_enabled:
+            return nullcontext()
+        return get_breaker(self.app_id, endpoint).guard(_is_upstream_failure)
     
     async def _get_tenant_access_token(self) -> str:
         """
         获取 tenant_access_token (带缓存)
+
+        查找顺序: 进程内缓存 -> 数据库 -> 飞书接口
+        """
+        cached = _token_cache.get(self.app_id)
+        if cached and cached.is_fresh():
+            return cached.token
+
+        # 同一进程内的并发请求只刷新一次
+        lock = _token_locks.setdefault(self.app_id, asyncio.Lock())
+        async with lock:
+            cached = _token_cache.get(self.app_id)
+            if cached and cached.is_fresh():
+                return cached.token
+
+            info = await self._load_or_refresh_token()
+            _token_cache[self.app_id] = info
+            return info.token
+
+    async def _load_or_refresh_token(self) -> TokenInfo:
+        """
+        从数据库读取 token, 过期时获取刷新租约后向飞书重新获取
+
+        其他进程持有租约时轮询等待其写回, 租约超时后自行获取
+        """
+        deadline = time.time() + TOKEN_LEASE_SECONDS
+        while True:
+            stored = token_store.load_token(self.app_id)
+            if stored:
+                info = TokenInfo(token=stored.token, expire_at=stored.expire_at)
+                if info.is_fresh():
+                    return info
+
+            owns_lease = token_store.acquire_refresh(self.app_id, TOKEN_LEASE_SECONDS)
+            if owns_lease or time.time() >= deadline:
+                break
+            await asyncio.sleep(0.2)
+
+        try:
+            info = await self._fetch_tenant_access_token()
+        except Exception:
+            if owns_lease:
+                token_store.release_refresh(self.app_id)
+            raise
+
+        token_store.save_token(self.app_id, info.token, info.expire_at)
+        return info
+
+    async def _invalidate_token(self, token: str):
+        """作废失效的 token (进程内缓存和数据库)"""
+        cached = _token_cache.get(self.app_id)
+        if cached and cached.token == token:
+            _token_cache.pop(self.app_id, None)
+        token_store.invalidate_token(self.app_id, token)
+
+    async def _fetch_tenant_access_token(self) -> TokenInfo:
+        """
+        向飞书获取新的 tenant_access_token
         文档: https://open.feishu.cn/document/server-docs/authentication-management/access-token/tenant_access_token_internal
         """
-        # 检查缓存是否有效 (提前5分钟过期)
-        if self._token_cache and self._token_cache.expire_at > time.time() + 300:
-            return self._token_cache.token
-        
         url = f"{self.base_url}/auth/v3/tenant_access_token/internal"
         payload = {
             "app_id": self.app_id,
             "app_secret": self.app_secret
         }
         
-        async with httpx.AsyncClient() as client:
-            resp = await client.post(url, json=payload)
-            resp.raise_for_status()
+        async with httpx.AsyncClient(timeout=self._timeout("token")) as client:
+            with span("lark_token"), self._guard("token"):
+                resp = await client.post(url, json=payload)
+                resp.raise_for_status()
             data = resp.json()
         
         if data.get("code") != 0:
@@ -58,12 +165,50 @@ class LarkClient:
         token = data["tenant_access_token"]
         expire = data.get("expire", 7200)  # 默认2小时
         
-        self._token_cache = TokenInfo(
+        return TokenInfo(
             token=token,
             expire_at=time.time() + expire
         )
-        
-        return token
+
+    async def _authorized_post(
+        self,
+        endpoint: str,
+        url: str,
+        headers: Optional[Dict[str, str]] = None,
+        **kwargs
+    ) -> Dict[str, Any]:
+        """
+        带 tenant_access_token 的 POST 请求
+
+        飞书返回 token 无效时作废缓存, 重新获取 token 后重试一次
+
+        Args:
+            endpoint: 熔断器接口名
+            url: 请求地址
+            headers: 额外请求头
+            **kwargs: 透传给 httpx 的参数 (json/files/data/params)
+        """
+        for attempt in range(2):
+            token = await self._get_tenant_access_token()
+            req_headers = {"Authorization": f"Bearer {token}", **(headers or {})}
+
+            async with httpx.AsyncClient(timeout=self._timeout(endpoint)) as client:
+                with span(f"lark_{endpoint}"), self._guard(endpoint):
+                    resp = await client.post(url, headers=req_headers, **kwargs)
+                    if resp.status_code >= 500 or resp.status_code == 429:
+                        resp.raise_for_status()
+
+            try:
+                result = resp.json()
+            except ValueError:
+                result = {}
+
+            if attempt == 0 and result.get("code") in TOKEN_INVALID_CODES:
+                await self._invalidate_token(token)
+                continue
+
+            resp.raise_for_status()
+            return result
     
     async def upload_image(self, image_data: bytes, image_type: str = "message") -> str:
         """
@@ -77,13 +222,8 @@ class LarkClient:
         Returns:
             image_key: 图片唯一标识
         """
-        token = await self._get_tenant_access_token()
         url = f"{self.base_url}/im/v1/images"
         
-        headers = {
-            "Authorization": f"Bearer {token}"
-        }
-        
         files = {
             "image": ("image.png", image_data, "image/png")
         }
@@ -91,10 +231,7 @@ class LarkClient:
             "image_type": image_type
         }
         
-        async with httpx.AsyncClient() as client:
-            resp = await client.post(url, headers=headers, files=files, data=data)
-            resp.raise_for_status()
-            result = resp.json()
+        result = await self._authorized_post("image_upload", url, files=files, data=data)
         
         if result.get("code") != 0:
             raise Exception(f"上传图片失败: {result.get('msg')}")
@@ -131,14 +268,16 @@ class LarkClient:
         if not content and not image_data_list:
             raise ValueError("content 或 image_data_list 至少提供一个")
 
+        # 发送接口已熔断时直接失败, 避免先上传图片
+        if settings.breaker_enabled:
+            get_breaker(self.app_id, "message_send").check()
+
         # 确定消息类型和构建消息体
         msg_type, msg_content = await self._build_message(title, content, image_data_list)
 
-        token = await self._get_tenant_access_token()
         url = f"{self.base_url}/im/v1/messages"
 
         headers = {
-            "Authorization": f"Bearer {token}",
             "Content-Type": "application/json; charset=utf-8"
         }
 
@@ -152,10 +291,9 @@ class LarkClient:
             "content": msg_content
         }
 
-        async with httpx.AsyncClient() as client:
-            resp = await client.post(url, headers=headers, params=params, json=payload)
-            resp.raise_for_status()
-            result = resp.json()
+        result = await self._authorized_post(
+            "message_send", url, headers=headers, params=params, json=payload
+        )
 
         if result.get("code") != 0:
             raise Exception(f"发送消息失败: {result.get('msg')}")
@@ -0,0 +1,119 @@
+"""
+tenant_access_token 持久化存储
+
+token 保存在加密数据库的 lark_tokens 表中, CLI 进程和服务重启后可直接复用。
+刷新时通过 refreshing_until 租约保证同一时间只有一个进程去飞书获取新 token,
+其他进程等待租约持有者写回结果。
+"""
+import time
+from typing import Optional
+
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from src.db.database import SessionLocal
+from src.db.models import LarkToken
+
+
+def load_token(app_id: str) -> Optional[LarkToken]:
+    """
+    读取已保存的 token (不存在或读取失败时返回 None)
+    """
+    db = SessionLocal()
+    try:
+        row = db.query(LarkToken).filter(LarkToken.app_id == app_id).first()
+        if not row or not row.token:
+            return None
+        db.expunge(row)
+        return row
+    except SQLAlchemyError:
+        return None
+    finally:
+        db.close()
+
+
+def acquire_refresh(app_id: str, lease_seconds: float) -> bool:
+    """
+    尝试获取刷新租约
+
+    Returns:
+        True 表示当前进程负责刷新; False 表示其他进程正在刷新
+    """
+    now = time.time()
+    db = SessionLocal()
+    try:
+        db.execute(
+            insert(LarkToken)
+            .values(app_id=app_id, token="", expire_at=0, refreshing_until=0)
+            .on_conflict_do_nothing(index_elements=["app_id"])
+        )
+        claimed = (
+            db.query(LarkToken)
+            .filter(LarkToken.app_id == app_id, LarkToken.refreshing_until < now)
+            .update({LarkToken.refreshing_until: now + lease_seconds}, synchronize_session=False)
+        )
+        db.commit()
+        return claimed == 1
+    except SQLAlchemyError:
+        db.rollback()
+        # 数据库不可用时由调用方自行获取
+        return True
+    finally:
+        db.close()
+
+
+def save_token(app_id: str, token: str, expire_at: float):
+    """
+    保存新 token 并释放刷新租约
+    """
+    db = SessionLocal()
+    try:
+        db.execute(
+            insert(LarkToken)
+            .values(app_id=app_id, token=token, expire_at=expire_at, refreshing_until=0)
+            .on_conflict_do_update(
+                index_elements=["app_id"],
+                set_={"token": token, "expire_at": expire_at, "refreshing_until": 0}
+            )
+        )
+        db.commit()
+    except SQLAlchemyError:
+        db.rollback()
+    finally:
+        db.close()
+
+
+def release_refresh(app_id: str):
+    """
+    刷新失败时释放租约, 让其他进程可以立即重试
+    """
+    db = SessionLocal()
+    try:
+        db.query(LarkToken).filter(LarkToken.app_id == app_id).update(
+            {LarkToken.refreshing_until: 0}, synchronize_session=False
+        )
+        db.commit()
+    except SQLAlchemyError:
+        db.rollback()
+    finally:
+        db.close()
+
+
+def invalidate_token(app_id: str, token: Optional[str] = None):
+    """
+    作废已保存的 token
+
+    Args:
+        token: 只有当前保存的 token 与之相同时才作废, 避免误删其他进程刚刷新的 token
+    """
+    db = SessionLocal()
+    try:
+        query = db.query(LarkToken).filter(LarkToken.app_id == app_id)
+        if token is not None:
+            query = query.filter(LarkToken.token == token)
+        query.update({LarkToken.token: "", LarkToken.expire_at: 0}, synchronize_session=False)
+        db.commit()
+    except SQLAlchemyError:
+        db.rollback()
+    finally:
+        db.close()
@@ -2,16 +2,20 @@
 LarkMsgServer - 飞书消息发送服务
 
 程序入口，整合 FastAPI 和 CLI
-"""
-from fastapi import FastAPI
 
-from src.config import settings
-from src.db.database import init_db
-from src.api.router import router
+FastAPI 及路由在 create_app 中按需导入, CLI 调用无需加载
+"""
 
 
-def create_app() -> FastAPI:
+def create_app():
     """创建 FastAPI 应用"""
+    from fastapi import FastAPI
+
+    from src.config import settings
+    from src.db.database import init_db, engine
+    from src.api.router import router
+    from src.scheduler import scheduler
+
     app = FastAPI(
         title="LarkMsgServer",
         description="飞书消息发送服务 - 支持多机器人、文本/图片/富文本消息",
@@ -22,11 +26,23 @@ def create_app() -> FastAPI:
     
     # 注册路由
     app.include_router(router)
+
+    # 请求追踪 (未开启时不注册中间件)
+    if settings.tracing_enabled:
+        from src.tracing import install
+        install(app, engine)
     
     # 启动事件
     @app.on_event("startup")
     async def startup():
         init_db()
+        if settings.scheduler_enabled:
+            scheduler.start()
+
+    # 停止事件
+    @app.on_event("shutdown")
+    async def shutdown():
+        await scheduler.stop()
     
     return app
 
@@ -0,0 +1,60 @@
+"""
+采样分析器
+
+后台线程定时采样所有线程的调用栈, 输出折叠栈格式 (每行 "帧;帧;帧 次数"),
+可直接用于 flamegraph.pl、speedscope、inferno 生成火焰图
+"""
+import sys
+import threading
+from collections import Counter
+from typing import Optional
+
+
+class SamplingProfiler:
+    """
+    纯 Python 采样分析器 (不依赖第三方库)
+
+    Args:
+        interval: 采样间隔 (秒)
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """开始采样"""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止采样"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        own_ident = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            thread_names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(thread_names.get(ident, str(ident)))
+                stack.reverse()
+
+                self.samples[";".join(stack)] += 1
+
+    def folded(self) -> str:
+        """折叠栈格式输出"""
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common()) + "\n"
@@ -0,0 +1,439 @@
+"""
+定时消息调度器
+
+消息持久化在 scheduled_messages 表中, 调度器运行在服务进程内:
+- 只按 (status, send_at) 索引加载前瞻窗口内到期的消息 id, 放入最小堆
+- 睡眠到堆顶到期或下一次加载时间, 新消息入库时可立即唤醒
+- 服务重启后, 已过期未发送的消息按计划时间顺序补发, 上次停止时处于 sending 的消息重新发送
+- 投递期间不占用数据库连接; 结果未能写回而长时间处于 sending 的消息, 超过租约后重新投递
+"""
+import asyncio
+import heapq
+import logging
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Set, Tuple
+
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import QueuePool
+
+from src.config import settings
+from src.db.database import SessionLocal, engine
+from src.db.models import Bot, ScheduledMessage
+
+logger = logging.getLogger(__name__)
+
+# 写回投递结果失败时的重试次数 (仍失败的由 sending 租约超时回收)
+_FINISH_ATTEMPTS = 3
+
+PENDING = "pending"
+SENDING = "sending"
+SENT = "sent"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+def to_utc_naive(dt: datetime) -> datetime:
+    """
+    转换为 UTC 无时区时间 (数据库存储格式)
+
+    无时区信息的时间按服务器本地时间处理
+    """
+    return dt.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _timestamp(dt: datetime) -> float:
+    """UTC 无时区时间 -> 时间戳"""
+    return dt.replace(tzinfo=timezone.utc).timestamp()
+
+
+def _from_timestamp(ts: float) -> datetime:
+    """时间戳 -> UTC 无时区时间"""
+    return datetime.fromtimestamp(ts, timezone.utc).replace(tzinfo=None)
+
+
+def schedule_message(
+    db: Session,
+    bot_name: str,
+    receive_id: str,
+    receive_id_type: str,
+    title: Optional[str],
+    content: Optional[str],
+    image_data_list: Optional[list[bytes]],
+    send_at: datetime
+) -> ScheduledMessage:
+    """
+    保存定时消息
+
+    Args:
+        send_at: 计划发送时间 (UTC 无时区), 早于当前时间时尽快发送
+    """
+    job = ScheduledMessage(
+        bot_name=bot_name,
+        receive_id=receive_id,
+        receive_id_type=receive_id_type,
+        title=title,
+        content=content,
+        send_at=send_at,
+        status=PENDING
+    )
+    job.set_images(image_data_list)
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+
+    scheduler.notify(job.id, job.send_at)
+    return job
+
+
+class MessageScheduler:
+    """
+    基于最小堆的定时消息调度器
+
+    内存中最多保留 scheduler_batch_size 条即将到期的消息 id,
+    其余消息留在数据库中, 随时间推移按索引分批加载
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[float, int]] = []
+        # 堆中和正在投递的消息 id, 避免重复加载
+        self._queued: Set[int] = set()
+        self._sending: Set[asyncio.Task] = set()
+        # 正在投递的消息 id (回收超时 sending 消息时排除)
+        self._delivering: Set[int] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._next_refill = 0.0
+        # 上次加载达到批量上限, 数据库中可能还有到期消息
+        self._more = False
+        # 上次加载没有新消息 (均在堆中或投递中), 等待投递完成后再加载
+        self._stalled = False
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """启动调度循环 (需在事件循环中调用)"""
+        if self.running:
+            return
+        self._wakeup = asyncio.Event()
+        self._semaphore = asyncio.Semaphore(self._concurrency())
+        self._next_refill = 0.0
+        self._more = False
+        self._stalled = False
+        self._recover()
+        self._task = asyncio.create_task(self._run())
+
+    @staticmethod
+    def _concurrency() -> int:
+        """
+        投递并发数
+
+        不超过数据库连接池容量 (pool_size + max_overflow) 的一半, 为 HTTP 请求保留连接
+        """
+        concurrency = max(1, settings.scheduler_concurrency)
+        pool = engine.pool
+        if isinstance(pool, QueuePool):
+            limit = max(1, (pool.size() + pool._max_overflow) // 2)
+            if concurrency > limit:
+                logger.warning(
+                    "scheduler_concurrency=%s 超过连接池容量的一半, 已限制为 %s", concurrency, limit
+                )
+                concurrency = limit
+        return concurrency
+
+    @staticmethod
+    def _recover():
+        """上次停止或崩溃时未完成的投递归还为 pending (至少一次投递)"""
+        db = SessionLocal()
+        try:
+            db.query(ScheduledMessage).filter(ScheduledMessage.status == SENDING).update(
+                {ScheduledMessage.status: PENDING}, synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    async def stop(self):
+        """停止调度循环, 未完成的消息归还为 pending, 下次启动后继续发送"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+        for task in list(self._sending):
+            task.cancel()
+        await asyncio.gather(*self._sending, return_exceptions=True)
+
+        self._heap.clear()
+        self._queued.clear()
+
+    def notify(self, job_id: int, send_at: datetime):
+        """
+        新消息入库或重新排期后调用
+
+        在前瞻窗口内的消息直接放入堆中并唤醒调度循环, 其余由定期加载处理
+        """
+        if not self.running or job_id in self._queued:
+            return
+
+        ts = _timestamp(send_at)
+        if ts > time.time() + settings.scheduler_lookahead_seconds:
+            return
+
+        heapq.heappush(self._heap, (ts, job_id))
+        self._queued.add(job_id)
+        self._wakeup.set()
+
+    def stats(self) -> dict:
+        """调度器状态 (用于健康检查)"""
+        return {
+            "running": self.running,
+            "queued": len(self._heap),
+            "sending": len(self._sending),
+        }
+
+    async def _run(self):
+        lookahead = settings.scheduler_lookahead_seconds
+        low_water = settings.scheduler_batch_size // 2
+
+        while True:
+            try:
+                now = time.time()
+                if now >= self._next_refill or self._needs_refill(low_water):
+                    self._refill(now)
+                    self._next_refill = now + lookahead / 2
+
+                while self._heap and self._heap[0][0] <= time.time():
+                    _, job_id = heapq.heappop(self._heap)
+                    # 并发达到上限时在此等待
+                    await self._semaphore.acquire()
+                    task = asyncio.create_task(self._deliver(job_id))
+                    self._sending.add(task)
+                    task.add_done_callback(self._sending.discard)
+
+                # clear 与 wait 之间没有 await, 不会丢失 notify
+                self._wakeup.clear()
+                timeout = self._next_refill - time.time()
+                if self._heap:
+                    timeout = min(timeout, self._heap[0][0] - time.time())
+                # 补发积压消息时不等待定期加载, 立即加载下一批
+                if self._needs_refill(low_water):
+                    timeout = 0
+
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=max(timeout, 0))
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("定时消息调度异常")
+                await asyncio.sleep(1)
+
+    def _needs_refill(self, low_water: int) -> bool:
+        """数据库中可能还有到期消息且堆中消息不足"""
+        return self._more and not self._stalled and len(self._heap) < low_water
+
+    def _refill(self, now: float):
+        """
+        按 (status, send_at) 索引加载前瞻窗口内最早到期的消息 id
+
+        加载前先回收认领超过租约仍未写回结果的 sending 消息
+        """
+        limit = settings.scheduler_batch_size
+        horizon = _from_timestamp(now + settings.scheduler_lookahead_seconds)
+
+        db = SessionLocal()
+        try:
+            self._reclaim(db, _from_timestamp(now - settings.scheduler_sending_lease_seconds))
+            rows = (
+                db.query(ScheduledMessage.id, ScheduledMessage.send_at)
+                .filter(ScheduledMessage.status == PENDING, ScheduledMessage.send_at <= horizon)
+                .order_by(ScheduledMessage.send_at, ScheduledMessage.id)
+                .limit(limit)
+                .all()
+            )
+        finally:
+            db.close()
+
+        added = 0
+        for job_id, send_at in rows:
+            if job_id not in self._queued:
+                heapq.heappush(self._heap, (_timestamp(send_at), job_id))
+                self._queued.add(job_id)
+                added += 1
+
+        self._more = len(rows) >= limit
+        self._stalled = added == 0
+
+    def _reclaim(self, db: Session, cutoff: datetime):
+        """超时未完成的投递 (非本进程在途) 归还为 pending"""
+        query = db.query(ScheduledMessage).filter(
+            ScheduledMessage.status == SENDING,
+            ScheduledMessage.claimed_at < cutoff
+        )
+        if self._delivering:
+            query = query.filter(ScheduledMessage.id.notin_(self._delivering))
+        reclaimed = query.update({ScheduledMessage.status: PENDING}, synchronize_session=False)
+        db.commit()
+        if reclaimed:
+            logger.warning("%s 条定时消息投递超时未完成, 重新发送", reclaimed)
+
+    async def _deliver(self, job_id: int):
+        """
+        投递单条定时消息
+
+        先通过条件更新 pending -> sending 认领, 认领失败 (已取消/已处理) 则跳过;
+        结果同样只写回仍处于 sending 的消息。失败时按指数退避加随机抖动重新排期,
+        熔断导致的快速失败不计入尝试次数。
+        认领和写回各使用独立的短会话, 等待飞书接口期间不占用数据库连接
+        """
+        from src.lark.breaker import CircuitOpenError
+        from src.lark.client import LarkClient
+
+        retry_at = None
+        self._delivering.add(job_id)
+        try:
+            claimed = self._claim(job_id)
+            if claimed is None:
+                return
+            job, bot = claimed
+            if bot is None:
+                await self._finish(job_id, status=FAILED, last_error=f"机器人 '{job['bot_name']}' 不存在或已禁用")
+                return
+
+            client = LarkClient(app_id=bot["app_id"], app_secret=bot["app_secret"])
+            try:
+                result = await client.send_message(
+                    receive_id=job["receive_id"],
+                    receive_id_type=job["receive_id_type"],
+                    title=job["title"],
+                    content=job["content"],
+                    image_data_list=job["images"]
+                )
+            except asyncio.CancelledError:
+                # 服务停止: 归还为 pending, 下次启动后重新发送 (写回失败时由启动时的恢复处理)
+                try:
+                    self._write_result(job_id, {"status": PENDING})
+                except SQLAlchemyError:
+                    logger.exception("定时消息 %s 归还失败", job_id)
+                raise
+            except Exception as e:
+                attempts = job["attempts"]
+                if isinstance(e, CircuitOpenError):
+                    delay = e.retry_after
+                else:
+                    attempts += 1
+                    delay = settings.scheduler_retry_seconds * 2 ** (attempts - 1)
+
+                if attempts >= settings.scheduler_max_attempts:
+                    await self._finish(job_id, status=FAILED, attempts=attempts, last_error=str(e))
+                else:
+                    # 随机抖动, 避免同时到期的消息在恢复时一起重试
+                    delay += random.uniform(0, settings.scheduler_retry_seconds)
+                    retry_at = datetime.utcnow() + timedelta(seconds=delay)
+                    await self._finish(
+                        job_id, status=PENDING, attempts=attempts,
+                        last_error=str(e), send_at=retry_at
+                    )
+                logger.warning("定时消息 %s 发送失败 (第 %s 次): %s", job_id, attempts, e)
+            else:
+                await self._finish(
+                    job_id,
+                    status=SENT,
+                    message_id=result.get("data", {}).get("message_id"),
+                    sent_at=datetime.utcnow(),
+                    last_error=None,
+                    # 已发送的消息不再需要图片数据
+                    images=None
+                )
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # 结果未写回的消息保持 sending, 超过租约后由 _refill 回收重新发送
+            retry_at = None
+            logger.exception("定时消息 %s 投递异常", job_id)
+        finally:
+            self._delivering.discard(job_id)
+            self._queued.discard(job_id)
+            self._semaphore.release()
+            # 允许调度循环重新加载 (可能有因在途消息而未能加载的到期消息)
+            self._stalled = False
+            self._wakeup.set()
+            if retry_at is not None:
+                self.notify(job_id, retry_at)
+
+    @staticmethod
+    def _claim(job_id: int) -> Optional[Tuple[dict, Optional[dict]]]:
+        """
+        认领待发送消息 (pending -> sending) 并读取投递所需字段
+
+        Returns:
+            (消息字段, 机器人凭证), 认领失败时返回 None; 机器人不存在或已禁用时凭证为 None
+        """
+        db = SessionLocal()
+        try:
+            claimed = (
+                db.query(ScheduledMessage)
+                .filter(ScheduledMessage.id == job_id, ScheduledMessage.status == PENDING)
+                .update(
+                    {ScheduledMessage.status: SENDING, ScheduledMessage.claimed_at: datetime.utcnow()},
+                    synchronize_session=False
+                )
+            )
+            if claimed != 1:
+                db.commit()
+                return None
+
+            row = db.get(ScheduledMessage, job_id)
+            job = {
+                "bot_name": row.bot_name,
+                "receive_id": row.receive_id,
+                "receive_id_type": row.receive_id_type,
+                "title": row.title,
+                "content": row.content,
+                "images": row.get_images(),
+                "attempts": row.attempts,
+            }
+            bot = db.query(Bot).filter(Bot.name == row.bot_name, Bot.enabled == True).first()
+            credentials = {"app_id": bot.app_id, "app_secret": bot.app_secret} if bot else None
+            db.commit()
+            return job, credentials
+        finally:
+            db.close()
+
+    async def _finish(self, job_id: int, **values):
+        """写回投递结果, 数据库异常时退避重试"""
+        for attempt in range(_FINISH_ATTEMPTS):
+            try:
+                self._write_result(job_id, values)
+                return
+            except SQLAlchemyError as e:
+                if attempt == _FINISH_ATTEMPTS - 1:
+                    raise
+                logger.warning("定时消息 %s 写回结果失败, 稍后重试: %s", job_id, e)
+                await asyncio.sleep(2 ** attempt)
+
+    @staticmethod
+    def _write_result(job_id: int, values: dict):
+        """写回投递结果 (仅当消息仍处于 sending)"""
+        db = SessionLocal()
+        try:
+            db.query(ScheduledMessage).filter(
+                ScheduledMessage.id == job_id, ScheduledMessage.status == SENDING
+            ).update(
+                {getattr(ScheduledMessage, k): v for k, v in values.items()},
+                synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+
+# 全局调度器 (由服务启动/停止事件管理)
+scheduler = MessageScheduler()
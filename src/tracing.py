@@ -0,0 +1,162 @@
+"""
+请求链路追踪
+
+开启 LARK_TRACING_ENABLED 后:
+- 每个 HTTP 请求创建一个 Trace, 通过 contextvar 传递给路由、数据库和飞书客户端
+- 响应头 Server-Timing 返回各阶段耗时, 同时输出一行 JSON 日志
+
+未开启时不注册中间件和数据库事件, span() 只做一次 contextvar 读取
+"""
+import json
+import logging
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Span:
+    """单个阶段耗时"""
+    name: str
+    start: float  # 相对请求开始的秒数
+    duration: float  # 秒
+    attrs: dict = field(default_factory=dict)
+
+
+class Trace:
+    """一次请求的全部 span"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = time.perf_counter()
+        self.spans: List[Span] = []
+
+    def add(self, name: str, start: float, end: float, **attrs):
+        """记录一个 span (start/end 为 perf_counter 值)"""
+        self.spans.append(Span(name, start - self.start, end - start, attrs))
+
+    def server_timing(self) -> str:
+        """
+        生成 Server-Timing 响应头, 同名 span 合并耗时并标注次数
+        """
+        totals: Dict[str, List[float]] = {}
+        for s in self.spans:
+            entry = totals.setdefault(s.name, [0.0, 0])
+            entry[0] += s.duration
+            entry[1] += 1
+
+        parts = []
+        for name, (duration, count) in totals.items():
+            part = f"{name};dur={duration * 1000:.1f}"
+            if count > 1:
+                part += f';desc="x{count}"'
+            parts.append(part)
+        parts.append(f"total;dur={(time.perf_counter() - self.start) * 1000:.1f}")
+        return ", ".join(parts)
+
+    def to_dict(self, **extra) -> dict:
+        """JSON 日志内容"""
+        return {
+            "trace": self.name,
+            "duration_ms": round((time.perf_counter() - self.start) * 1000, 1),
+            **extra,
+            "spans": [
+                {
+                    "name": s.name,
+                    "start_ms": round(s.start * 1000, 1),
+                    "duration_ms": round(s.duration * 1000, 1),
+                    **s.attrs
+                }
+                for s in self.spans
+            ],
+        }
+
+
+_current: ContextVar[Optional[Trace]] = ContextVar("lark_trace", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    """当前请求的 Trace (未开启追踪时为 None)"""
+    return _current.get()
+
+
+@contextmanager
+def _record(trace: Trace, name: str, attrs: dict) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, start, time.perf_counter(), **attrs)
+
+
+def span(name: str, **attrs):
+    """
+    记录一段代码的耗时
+
+    用法:
+        with span("bot_lookup"):
+            ...
+    """
+    trace = _current.get()
+    if trace is None:
+        return nullcontext()
+    return _record(trace, name, attrs)
+
+
+def mark(name: str, **attrs):
+    """记录从请求开始到现在的耗时 (如请求体解析)"""
+    trace = _current.get()
+    if trace is not None:
+        trace.add(name, trace.start, time.perf_counter(), **attrs)
+
+
+# 开始时间保存在单条语句的 execution context 上, 语句出错时随之丢弃, 不会残留在连接池连接中
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and _current.get() is not None:
+        context._trace_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    trace = _current.get()
+    start = getattr(context, "_trace_start", None)
+    if trace is None or start is None:
+        return
+    trace.add("db", start, time.perf_counter(), sql=statement[:200])
+
+
+def install(app, engine):
+    """
+    为 FastAPI 应用注册追踪中间件和数据库查询事件
+    """
+    from sqlalchemy import event
+
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+    @app.middleware("http")
+    async def tracing_middleware(request, call_next):
+        trace = Trace(f"{request.method} {request.url.path}")
+        token = _current.set(trace)
+        try:
+            response = await call_next(request)
+        except Exception as e:
+            # 未处理异常 (500) 同样输出追踪日志, 慢请求/失败请求正是排查重点
+            logger.info(json.dumps(trace.to_dict(status=500, error=repr(e)), ensure_ascii=False))
+            raise
+        finally:
+            _current.reset(token)
+
+        response.headers["Server-Timing"] = trace.server_timing()
+        logger.info(json.dumps(trace.to_dict(status=response.status_code), ensure_ascii=False))
+        return response